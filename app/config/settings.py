@@ -1,44 +1,117 @@
 """
 Configuración de la aplicación.
 Carga variables de entorno y define parámetros de configuración.
+
+pydantic se importa de forma diferida: `settings` y `Settings` se materializan
+en el primer acceso (PEP 562), no al importar el módulo.
 """
 import os
-from dotenv import load_dotenv
-from pydantic_settings import BaseSettings
-from pydantic import Field
-
-load_dotenv()
+from functools import lru_cache
+from typing import Any, Literal
 
 LLM = "gpt-4o-mini"
 
-class Settings(BaseSettings):
-    """Configuración centralizada de la aplicación usando Pydantic."""
-    openai_api_key: str = Field(default=os.getenv("OPENAI_API_KEY", ""), env="OPENAI_API_KEY")
-    
-    embedding_model_name: str = Field(default="text-embedding-ada-002", env="EMBEDDING_MODEL_NAME")
-    llm_model_name: str = Field(default=LLM, env="LLM_MODEL_NAME")
-    summarizer_model_name: str = Field(default=LLM, env="SUMMARIZER_MODEL_NAME")
+@lru_cache(maxsize=None)
+def _settings_class():
+    """
+    Define la clase de configuración importando pydantic solo cuando se necesita.
     
-    # RAG
-    chunk_size: int = Field(default=1000, env="CHUNK_SIZE")
-    chunk_overlap: int = Field(default=200, env="CHUNK_OVERLAP")
-    retrieval_k: int = Field(default=4, env="RETRIEVAL_K")
+    Returns:
+        type: Clase Settings.
+    """
+    from pydantic_settings import BaseSettings
+    from pydantic import Field
     
-    max_memory_tokens: int = Field(default=2000, env="MAX_MEMORY_TOKENS")
-    char_to_token_ratio: int = Field(default=4, env="CHAR_TO_TOKEN_RATIO")
+    class Settings(BaseSettings):
+        """Configuración centralizada de la aplicación usando Pydantic."""
+        openai_api_key: str = Field(default="", validation_alias="OPENAI_API_KEY")
+        
+        embedding_model_name: str = Field(default="text-embedding-ada-002", validation_alias="EMBEDDING_MODEL_NAME")
+        llm_model_name: str = Field(default=LLM, validation_alias="LLM_MODEL_NAME")
+        summarizer_model_name: str = Field(default=LLM, validation_alias="SUMMARIZER_MODEL_NAME")
+        
+        # Embeddings
+        embedding_backend: Literal["openai", "onnx"] = Field(default="openai", validation_alias="EMBEDDING_BACKEND")
+        onnx_model_path: str = Field(default="./models/embeddings/model.onnx", validation_alias="ONNX_MODEL_PATH")
+        onnx_tokenizer_path: str = Field(default="./models/embeddings/tokenizer.json", validation_alias="ONNX_TOKENIZER_PATH")
+        onnx_batch_size: int = Field(default=64, validation_alias="ONNX_BATCH_SIZE")
+        
+        # RAG
+        chunk_size: int = Field(default=1000, validation_alias="CHUNK_SIZE")
+        chunk_overlap: int = Field(default=200, validation_alias="CHUNK_OVERLAP")
+        retrieval_k: int = Field(default=4, validation_alias="RETRIEVAL_K")
+        
+        # Caché de respuestas (0 la desactiva)
+        response_cache_size: int = Field(default=128, validation_alias="RESPONSE_CACHE_SIZE")
+        semantic_cache_threshold: float = Field(default=0.95, validation_alias="SEMANTIC_CACHE_THRESHOLD")
+        
+        # Memoria: "sliding" (ventana de mensajes) o "summary" (resumen con LLM)
+        memory_strategy: Literal["sliding", "summary"] = Field(default="sliding", validation_alias="MEMORY_STRATEGY")
+        memory_window_size: int = Field(default=10, validation_alias="MEMORY_WINDOW_SIZE")
+        hard_history_cap: int = Field(default=200, validation_alias="HARD_HISTORY_CAP")
+        max_memory_tokens: int = Field(default=2000, validation_alias="MAX_MEMORY_TOKENS")
+        char_to_token_ratio: int = Field(default=4, validation_alias="CHAR_TO_TOKEN_RATIO")
+        
+        # Ejecución de código
+        max_code_len: int = Field(default=20000, validation_alias="MAX_CODE_LEN")
+        
+        vector_db_path: str = Field(default="./data/chroma_db", validation_alias="VECTOR_DB_PATH")
+        enable_vector_db_persistence: bool = Field(default=True, validation_alias="ENABLE_VECTOR_DB_PERSISTENCE")
+        
+        host: str = Field(default="0.0.0.0", validation_alias="HOST")
+        port: int = Field(default=7860, validation_alias="PORT")
+        
+        # El logging lo lee con get_log_level(), sin construir Settings: mantener ambos en sincronía
+        log_level: str = Field(default="INFO", validation_alias="LOG_LEVEL")
+        
+        class Config:
+            env_file = ".env"
+            env_file_encoding = "utf-8"
+            case_sensitive = False
     
-    vector_db_path: str = Field(default="./data/chroma_db", env="VECTOR_DB_PATH")
-    enable_vector_db_persistence: bool = Field(default=True, env="ENABLE_VECTOR_DB_PERSISTENCE")
-    
-    host: str = Field(default="0.0.0.0", env="HOST")
-    port: int = Field(default=7860, env="PORT")
+    return Settings
+
+
+def _load_env() -> None:
+    """Carga el archivo .env una sola vez por proceso (incluidos recargas y subprocesos)."""
+    if not os.environ.get("_DOTENV_LOADED"):
+        from dotenv import load_dotenv
+        
+        load_dotenv()
+        os.environ["_DOTENV_LOADED"] = "1"
+
+
+def get_log_level() -> str:
+    """
+    Lee el nivel de log sin construir Settings (ni importar pydantic).
     
-    log_level: str = Field(default="INFO", env="LOG_LEVEL")
+    Returns:
+        str: Valor de LOG_LEVEL del entorno o del archivo .env; "INFO" por defecto.
+    """
+    _load_env()
+    # Debe leer lo mismo que Settings.log_level: LOG_LEVEL sin distinguir mayúsculas (case_sensitive=False)
+    for key, value in os.environ.items():
+        if key.lower() == "log_level":
+            return value
+    return "INFO"
+
+
+@lru_cache(maxsize=None)
+def get_settings() -> Any:
+    """
+    Devuelve la instancia única de configuración.
     
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
-        case_sensitive = False
+    Returns:
+        Settings: Configuración de la aplicación, construida en la primera llamada.
+    """
+    _load_env()
+    return _settings_class()()
 
 
-settings = Settings()
\ No newline at end of file
+def __getattr__(name: str):
+    """Materializa `settings` y `Settings` en el primer acceso."""
+    if name == "settings":
+        return get_settings()
+    if name == "Settings":
+        return _settings_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
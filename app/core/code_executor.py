@@ -1,9 +1,12 @@
 """
 Ejecución segura de código Python.
 """
+import importlib
 import io
+import re
 import traceback
 from contextlib import redirect_stdout, redirect_stderr
+from functools import lru_cache
 from typing import Dict, Any
 
 from utils.security import is_safe_code, sanitize_code_output
@@ -11,23 +14,136 @@ from utils.logging_config import setup_logger
 
 logger = setup_logger("code_executor", "code_executor.log")
 
+# Palabras clave que indican necesidad de cálculos precisos
+CODE_KEYWORDS = (
+    "calcula", "calcular", "calcule", "resultado exacto", "precisión numérica",
+    "computa", "computar", "cómputo", "ejecuta", "ejecutar", "código",
+    "python", "algoritmo", "exactitud", "decimal", "número exacto",
+    "estadística", "matemáticas", "fórmula", "ecuación"
+)
+
+# Patrones numéricos (requieren al menos un dígito)
+NUMERIC_PATTERNS = (
+    r'\d+\s*[+\-*/^]\s*\d+',  # Operaciones matemáticas básicas
+    r'\d+\s*%'  # Porcentajes
+)
+
+# Términos matemáticos
+MATH_TERM_PATTERNS = (
+    r'raíz\s+cuadrada',
+    r'logaritmo',
+    r'factorial',
+    r'media|mediana|moda|promedio',
+    r'desviación\s+estándar',
+    r'probabilidad'
+)
+
+# Compilados una sola vez: una pasada para las palabras y otra, solo si hay dígitos, para los números
+_KEYWORD_RE = re.compile(
+    "|".join(list(map(re.escape, CODE_KEYWORDS)) + list(MATH_TERM_PATTERNS)),
+    re.IGNORECASE
+)
+_NUMERIC_RE = re.compile("|".join(NUMERIC_PATTERNS))
+_DIGITS = frozenset("0123456789")
+
+
+# Plantillas de prompts, definidas una sola vez
+_CODE_GEN_TEMPLATE = """
+        El usuario ha realizado una consulta que requiere cálculos precisos o ejecución de código:
+        
+        "{query}"
+        
+        Genera ÚNICAMENTE código Python para resolver esta consulta. El código debe:
+        1. Ser claro, eficiente y seguir las mejores prácticas
+        2. Incluir comentarios explicativos
+        3. Manejar posibles errores
+        4. Mostrar resultados con print() para que sean visibles
+        5. Usar bibliotecas estándar o numpy/pandas si es necesario
+        
+        NO expliques el código, NO incluyas markdown. Proporciona SOLAMENTE el código Python.
+        """
+
+_EXPLAIN_TEMPLATE = """
+        El usuario preguntó: "{query}"
+        
+        Para responder con precisión, generé y ejecuté el siguiente código Python:
+        
+        ```python
+        {code}
+        ```
+        
+        El código {status_text}. 
+        
+        Resultado de la ejecución:
+        
+        SALIDA ESTÁNDAR:
+        {stdout}
+        
+        {errors_header}
+        {stderr}
+        {error}
+        
+        {variables_header}
+        {var_str}
+        
+        Por favor, explica el resultado al usuario de manera clara y concisa, 
+        relacionándolo con su pregunta original. 
+        
+        La explicación debe:
+        1. Responder directamente a la consulta del usuario
+        2. Explicar el significado del resultado (no el código)
+        3. Ser concisa pero completa
+        4. Incluir los valores numéricos o resultados relevantes
+        5. No mencionar el proceso de generación de código a menos que sea relevante
+        
+        Si hubo errores, explica el problema de manera sencilla y proporciona una respuesta alternativa si es posible.
+        """
+
+
+@lru_cache(maxsize=128)
+def _compile_code(code: str):
+    """Compila el código una sola vez para generaciones idénticas repetidas."""
+    return compile(code, "<generated>", "exec")
+
+
 class CodeExecutor:
     """
     Ejecuta código Python de manera segura.
     """
     def __init__(self):
         """Inicializa el ejecutor de código."""
-        # Módulos permitidos
+        # Módulos permitidos: nombre en el entorno -> (módulo, atributo)
         self.allowed_imports = {
-            "math": "import math",
-            "random": "import random",
-            "datetime": "from datetime import datetime, date, timedelta",
-            "statistics": "import statistics",
-            "pandas": "import pandas as pd",
-            "numpy": "import numpy as np",
-            "re": "import re",
-            "collections": "import collections"
+            "math": ("math", None),
+            "random": ("random", None),
+            "datetime": ("datetime", "datetime"),
+            "date": ("datetime", "date"),
+            "timedelta": ("datetime", "timedelta"),
+            "statistics": ("statistics", None),
+            "pd": ("pandas", None),
+            "np": ("numpy", None),
+            "re": ("re", None),
+            "collections": ("collections", None)
         }
+        # Entorno global preparado una sola vez con los módulos ya importados
+        self._exec_globals = self._build_exec_globals()
+    
+    def _build_exec_globals(self) -> Dict[str, Any]:
+        """
+        Construye el diccionario de globals con los módulos permitidos.
+        
+        Returns:
+            Dict[str, Any]: Globals para la ejecución del código.
+        """
+        exec_globals = {"__builtins__": __builtins__}
+        for name, (module_name, attr) in self.allowed_imports.items():
+            try:
+                module = importlib.import_module(module_name)
+            except ImportError as e:
+                logger.warning(f"Módulo permitido no disponible {module_name}: {str(e)}")
+                continue
+            exec_globals[name] = getattr(module, attr) if attr else module
+        return exec_globals
     
     def detect_code_execution_needed(self, query: str) -> bool:
         """
@@ -39,34 +155,15 @@ class CodeExecutor:
         Returns:
             bool: True si se requiere ejecución de código.
         """
-        # Palabras clave que indican necesidad de cálculos precisos
-        code_keywords = [
-            "calcula", "calcular", "calcule", "resultado exacto", "precisión numérica",
-            "computa", "computar", "cómputo", "ejecuta", "ejecutar", "código",
-            "python", "algoritmo", "exactitud", "decimal", "número exacto",
-            "estadística", "matemáticas", "fórmula", "ecuación"
-        ]
-        
-        query_lower = query.lower()
-        
-        keyword_match = any(keyword in query_lower for keyword in code_keywords)
-        
-        # Verificar patrones numéricos o matemáticos
-        math_patterns = [
-            r'\d+\s*[+\-*/^]\s*\d+',  # Operaciones matemáticas básicas
-            r'\d+\s*%',  # Porcentajes
-            r'raíz\s+cuadrada',
-            r'logaritmo',
-            r'factorial',
-            r'media|mediana|moda|promedio',
-            r'desviación\s+estándar',
-            r'probabilidad'
-        ]
-        
-        import re
-        math_match = any(re.search(pattern, query_lower) for pattern in math_patterns)
-        
-        return keyword_match or math_match
+        if _KEYWORD_RE.search(query):
+            return True
+        
+        # Filtro previo: sin dígitos ningún patrón numérico puede coincidir. Solo se aplica
+        # a texto ASCII; con otros caracteres \d también admite dígitos Unicode
+        if query.isascii() and _DIGITS.isdisjoint(query):
+            return False
+        
+        return bool(_NUMERIC_RE.search(query))
     
     def generate_code(self, llm, query: str) -> str:
         """
@@ -79,20 +176,7 @@ class CodeExecutor:
         Returns:
             str: Código Python generado.
         """
-        code_generation_prompt = f"""
-        El usuario ha realizado una consulta que requiere cálculos precisos o ejecución de código:
-        
-        "{query}"
-        
-        Genera ÚNICAMENTE código Python para resolver esta consulta. El código debe:
-        1. Ser claro, eficiente y seguir las mejores prácticas
-        2. Incluir comentarios explicativos
-        3. Manejar posibles errores
-        4. Mostrar resultados con print() para que sean visibles
-        5. Usar bibliotecas estándar o numpy/pandas si es necesario
-        
-        NO expliques el código, NO incluyas markdown. Proporciona SOLAMENTE el código Python.
-        """
+        code_generation_prompt = _CODE_GEN_TEMPLATE.format(query=query)
         
         try:
             code_response = llm.invoke(code_generation_prompt)
@@ -135,17 +219,14 @@ class CodeExecutor:
         output_buffer = io.StringIO()
         error_buffer = io.StringIO()
         
-        # Añadir importaciones comunes
-        augmented_code = "\n".join(self.allowed_imports.values()) + "\n\n" + code
-        
         # Variables locales para la ejecución
         local_vars = {}
         
         try:
             # Ejecutar código redirigiendo stdout y stderr
             with redirect_stdout(output_buffer), redirect_stderr(error_buffer):
-                # Usar exec con globals limitados
-                exec(augmented_code, {"__builtins__": __builtins__}, local_vars)
+                # Usar exec con una copia de los globals preparados (módulos ya importados)
+                exec(_compile_code(code), dict(self._exec_globals), local_vars)
             
             # Recuperar salida y errores
             stdout = sanitize_code_output(output_buffer.getvalue())
@@ -196,43 +277,19 @@ class CodeExecutor:
         variables = execution_result.get("variables", {})
         
         # Formatear variables para la explicación
-        var_str = "\n".join([f"{k} = {v}" for k, v in variables.items() if not k.startswith("_")])
-        
-        explanation_prompt = f"""
-        El usuario preguntó: "{query}"
-        
-        Para responder con precisión, generé y ejecuté el siguiente código Python:
-        
-        ```python
-        {code}
-        ```
-        
-        El código {"se ejecutó correctamente" if status == "success" else "encontró errores"}. 
-        
-        Resultado de la ejecución:
-        
-        SALIDA ESTÁNDAR:
-        {stdout}
-        
-        {"ERRORES:" if stderr or error else ""}
-        {stderr}
-        {error}
-        
-        {"VARIABLES FINALES:" if var_str else ""}
-        {var_str}
-        
-        Por favor, explica el resultado al usuario de manera clara y concisa, 
-        relacionándolo con su pregunta original. 
-        
-        La explicación debe:
-        1. Responder directamente a la consulta del usuario
-        2. Explicar el significado del resultado (no el código)
-        3. Ser concisa pero completa
-        4. Incluir los valores numéricos o resultados relevantes
-        5. No mencionar el proceso de generación de código a menos que sea relevante
-        
-        Si hubo errores, explica el problema de manera sencilla y proporciona una respuesta alternativa si es posible.
-        """
+        var_str = "\n".join(f"{k} = {v}" for k, v in variables.items() if not k.startswith("_"))
+        
+        explanation_prompt = _EXPLAIN_TEMPLATE.format(
+            query=query,
+            code=code,
+            status_text="se ejecutó correctamente" if status == "success" else "encontró errores",
+            stdout=stdout,
+            errors_header="ERRORES:" if stderr or error else "",
+            stderr=stderr,
+            error=error,
+            variables_header="VARIABLES FINALES:" if var_str else "",
+            var_str=var_str
+        )
         
         try:
             explanation = llm.invoke(explanation_prompt).content
@@ -1,21 +1,241 @@
 """
 Procesamiento de documentos para RAG.
 """
+import hashlib
+import io
 import os
-import tempfile
-from typing import List, Dict, Any
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
+import chromadb
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
-from langchain_openai import OpenAIEmbeddings
+from pypdf import PdfReader
 
 from config.settings import settings
+from core.embeddings import embedding_fingerprint, get_embedding_model
 from utils.logging_config import setup_logger
 
 logger = setup_logger("document_processor", "document_processor.log")
 
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # Backend opcional; sin él se usa pypdf
+    pdfium = None
+
+# PDFium no es seguro entre hilos (ni siquiera con documentos distintos) y Gradio puede atender
+# varias subidas de archivos a la vez: sus llamadas se serializan
+_PDFIUM_LOCK = threading.Lock()
+
+# Número de consultas cuyos resultados de búsqueda se mantienen en caché
+RETRIEVAL_CACHE_SIZE = 256
+
+# Número de consultas cuyo embedding se mantiene en caché (sigue siendo válido al añadir documentos)
+QUERY_EMBEDDING_CACHE_SIZE = 128
+
+# Número de fragmentos enviados en cada llamada a add_documents
+ADD_DOCUMENTS_BATCH_SIZE = 128
+
+# Colección de Chroma y parámetros HNSW con los que se crea (k pequeño: más recall por poca latencia)
+COLLECTION_NAME = "langchain"
+# Modelo de embeddings de la colección original; el resto de modelos usa su propia colección
+DEFAULT_EMBEDDING_FINGERPRINT = "openai:text-embedding-ada-002"
+HNSW_COLLECTION_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:M": 32,
+    "hnsw:construction_ef": 200,
+    "hnsw:search_ef": 32
+}
+
+# Puntos de corte preferidos: espacios tras un final de frase o salto de línea
+_SPLIT_RE = re.compile(r"[.?!\n]\s+")
+# Puntos de corte secundarios: espacios y saltos de línea, para no partir palabras.
+# Solo se buscan dentro del tramo actual cuando no hay un final de frase
+_SPACE_CHARS = (" ", "\n", "\t")
+
+# Plantilla de cada documento incluido en el prompt
+_DOC_TEMPLATE = "--- Documento {index} (Fuente: {source}, Página: {page}) ---\n{content}\n"
+
+def _collection_name(embedding_fingerprint: str) -> str:
+    """
+    Nombre de la colección de Chroma para un modelo de embeddings, de modo que
+    vectores de modelos (y dimensiones) distintos nunca se mezclen.
+    
+    Args:
+        embedding_fingerprint (str): Identificador del modelo de embeddings.
+    
+    Returns:
+        str: COLLECTION_NAME para el modelo por defecto; si no, con un sufijo del modelo.
+    """
+    if embedding_fingerprint == DEFAULT_EMBEDDING_FINGERPRINT:
+        return COLLECTION_NAME
+    digest = hashlib.sha1(embedding_fingerprint.encode("utf-8")).hexdigest()[:12]
+    return f"{COLLECTION_NAME}-{digest}"
+
+@lru_cache(maxsize=4)
+def _get_chroma(path: str, embedding_fingerprint: str) -> Chroma:
+    """
+    Abre la base vectorial persistente una sola vez por ruta y modelo de embeddings,
+    con un único PersistentClient de Chroma por ruta y una colección por modelo.
+    
+    Args:
+        path (str): Directorio de persistencia.
+        embedding_fingerprint (str): Identificador del modelo de embeddings.
+    
+    Returns:
+        Chroma: Base de datos vectorial.
+    """
+    os.makedirs(path, exist_ok=True)
+    client = chromadb.PersistentClient(path=path)
+    
+    collection_name = _collection_name(embedding_fingerprint)
+    
+    # Los parámetros HNSW solo pueden fijarse al crear la colección
+    try:
+        client.get_collection(collection_name)
+        collection_metadata = None
+    except Exception:
+        collection_metadata = HNSW_COLLECTION_METADATA
+    
+    vector_db = Chroma(
+        client=client,
+        collection_name=collection_name,
+        embedding_function=get_embedding_model(),
+        collection_metadata=collection_metadata
+    )
+    logger.info(f"Base de datos vectorial cargada desde {path} (colección {collection_name})")
+    return vector_db
+
+
+def split_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    """
+    Divide un texto en fragmentos de como máximo chunk_size caracteres.
+    
+    Los cortes se hacen en finales de frase o de línea siempre que es posible;
+    si un tramo no tiene ninguno, se corta en un espacio, y solo si tampoco
+    hay espacios se corta a chunk_size caracteres. Cada fragmento comienza
+    chunk_overlap caracteres antes del final del anterior, ajustado al primer
+    punto de corte de esa ventana si lo hay.
+    
+    Args:
+        text (str): Texto a dividir.
+        chunk_size (int): Tamaño máximo de cada fragmento.
+        chunk_overlap (int): Solapamiento entre fragmentos consecutivos.
+    
+    Returns:
+        List[str]: Fragmentos de texto.
+    
+    Raises:
+        ValueError: Si chunk_overlap no es menor que chunk_size.
+    """
+    if chunk_overlap >= chunk_size:
+        raise ValueError(
+            f"El solapamiento ({chunk_overlap}) debe ser menor que el tamaño de fragmento ({chunk_size})"
+        )
+    
+    length = len(text)
+    boundaries = [m.end() for m in _SPLIT_RE.finditer(text)]
+    boundaries.append(length)
+    
+    chunks = []
+    start = 0
+    prev_end = 0
+    while start < length:
+        # Último punto de corte que cabe en el fragmento: frase, luego espacio, luego corte duro.
+        # Debe quedar después del final anterior para que cada fragmento aporte texto nuevo.
+        limit = start + chunk_size
+        end = (
+            _last_boundary(boundaries, prev_end, limit)
+            or _last_space(text, prev_end, limit)
+            or min(limit, length)
+        )
+        prev_end = end
+        
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= length:
+            break
+        
+        # Primer punto de corte dentro de la ventana de solapamiento; sin ninguno, el solapamiento exacto
+        window_start = max(end - chunk_overlap, start + 1)
+        next_start = (
+            _first_boundary(boundaries, window_start, end)
+            or _first_space(text, window_start, end)
+            or window_start
+        )
+        start = next_start if next_start < end else end
+    
+    return chunks
+
+
+def _last_boundary(boundaries: List[int], start: int, limit: int) -> Optional[int]:
+    """
+    Busca el último punto de corte en (start, limit].
+    
+    Args:
+        boundaries (List[int]): Posiciones de corte ordenadas.
+        start (int): Posición mínima (excluida).
+        limit (int): Posición máxima (incluida).
+    
+    Returns:
+        Optional[int]: Posición encontrada, o None.
+    """
+    idx = bisect_right(boundaries, limit) - 1
+    return boundaries[idx] if idx >= 0 and boundaries[idx] > start else None
+
+
+def _first_boundary(boundaries: List[int], window_start: int, end: int) -> Optional[int]:
+    """
+    Busca el primer punto de corte en [window_start, end).
+    
+    Args:
+        boundaries (List[int]): Posiciones de corte ordenadas.
+        window_start (int): Inicio de la ventana (incluido).
+        end (int): Final del fragmento anterior (excluido).
+    
+    Returns:
+        Optional[int]: Posición encontrada, o None.
+    """
+    idx = bisect_left(boundaries, window_start)
+    return boundaries[idx] if idx < len(boundaries) and boundaries[idx] < end else None
+
+
+def _last_space(text: str, start: int, limit: int) -> Optional[int]:
+    """
+    Busca la posición tras el último espacio en (start, limit].
+    
+    Args:
+        text (str): Texto completo.
+        start (int): Posición mínima (excluida).
+        limit (int): Posición máxima (incluida).
+    
+    Returns:
+        Optional[int]: Posición encontrada, o None.
+    """
+    found = max(text.rfind(char, start, limit) for char in _SPACE_CHARS)
+    return found + 1 if found >= 0 else None
+
+
+def _first_space(text: str, window_start: int, end: int) -> Optional[int]:
+    """
+    Busca la posición tras el primer espacio en [window_start, end).
+    
+    Args:
+        text (str): Texto completo.
+        window_start (int): Inicio de la ventana (incluido).
+        end (int): Final del fragmento anterior (excluido).
+    
+    Returns:
+        Optional[int]: Posición encontrada, o None.
+    """
+    found = [i for i in (text.find(char, window_start - 1, end - 1) for char in _SPACE_CHARS) if i >= 0]
+    return min(found) + 1 if found else None
+
+
 class DocumentProcessor:
     """
     Clase para el procesamiento y gestión de documentos.
@@ -23,52 +243,80 @@ class DocumentProcessor:
     def __init__(self):
         """Inicializa el procesador de documentos."""
         self.vector_db = None
-        self.embedding_model = OpenAIEmbeddings(
-            model=settings.embedding_model_name,
-            openai_api_key=settings.openai_api_key
-        )
+        # Versión de la base vectorial; invalida la caché de búsquedas al añadir documentos
+        self._db_version = 0
+        self._cached_search = lru_cache(maxsize=RETRIEVAL_CACHE_SIZE)(self._search)
+        self._cached_embed = lru_cache(maxsize=QUERY_EMBEDDING_CACHE_SIZE)(self._embed_query)
+        self.embedding_model = get_embedding_model()
         
-        # Crear directorio para base de datos vectorial si no existe
+        # Reutilizar la base vectorial persistente si ya se abrió en este proceso
         if settings.enable_vector_db_persistence:
-            os.makedirs(settings.vector_db_path, exist_ok=True)
-            
-            # Intentar cargar la base de datos si existe
             try:
-                self.vector_db = Chroma(
-                    persist_directory=settings.vector_db_path,
-                    embedding_function=self.embedding_model
-                )
-                logger.info(f"Base de datos vectorial cargada desde {settings.vector_db_path}")
+                self.vector_db = _get_chroma(settings.vector_db_path, embedding_fingerprint())
             except Exception as e:
                 logger.warning(f"No se pudo cargar la base de datos vectorial: {str(e)}")
     
-    def process_pdfs(self, pdf_files: List[bytes]) -> Dict[str, Any]:
+    def _extract_pages(self, pdf_file: bytes, source: str) -> List[Document]:
+        """
+        Extrae el texto de un PDF página a página.
+        
+        El PDF se lee directamente desde memoria, con pypdfium2 si está
+        instalado (una extracción a la vez, por si coinciden varias subidas:
+        PDFium no es seguro entre hilos) o con pypdf en caso contrario.
+        
+        Args:
+            pdf_file (bytes): Contenido del PDF en formato binario.
+            source (str): Nombre del documento para los metadatos.
+        
+        Returns:
+            List[Document]: Una entrada por página.
+        """
+        if pdfium is not None:
+            with _PDFIUM_LOCK:
+                pdf = pdfium.PdfDocument(pdf_file)
+                try:
+                    pages = []
+                    for page_number, page in enumerate(pdf):
+                        textpage = page.get_textpage()
+                        pages.append(Document(
+                            page_content=textpage.get_text_bounded(),
+                            metadata={"source": source, "page": page_number}
+                        ))
+                        textpage.close()
+                        page.close()
+                    return pages
+                finally:
+                    pdf.close()
+        
+        reader = PdfReader(io.BytesIO(pdf_file))
+        return [
+            Document(
+                page_content=page.extract_text() or "",
+                metadata={"source": source, "page": page_number}
+            )
+            for page_number, page in enumerate(reader.pages)
+        ]
+    
+    def process_pdfs(self, pdf_files: List[bytes], file_names: Optional[List[str]] = None) -> Dict[str, Any]:
         """
         Procesa archivos PDF y los carga en la base de datos vectorial.
         
         Args:
             pdf_files (List[bytes]): Lista de archivos PDF en formato binario.
+            file_names (List[str], optional): Nombres de los archivos, usados como fuente.
         
         Returns:
             Dict[str, Any]: Resultados del procesamiento.
         """
         documents = []
-        temp_files = []
         stats = {"success": 0, "failed": 0, "chunks": 0}
+        sources = file_names or [f"PDF {i+1}" for i in range(len(pdf_files))]
         
         try:
             # Procesar cada archivo PDF
-            for i, pdf_file in enumerate(pdf_files):
+            for i, (pdf_file, source) in enumerate(zip(pdf_files, sources)):
                 try:
-                    # Crear archivo temporal
-                    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-                    temp_file.write(pdf_file)
-                    temp_file.close()
-                    temp_files.append(temp_file.name)
-                    
-                    # Cargar PDF
-                    loader = PyPDFLoader(temp_file.name)
-                    pdf_documents = loader.load()
+                    pdf_documents = self._extract_pages(pdf_file, source)
                     
                     if pdf_documents:
                         documents.extend(pdf_documents)
@@ -84,32 +332,29 @@ class DocumentProcessor:
             
             # Dividir documentos en chunks
             if documents:
-                text_splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=settings.chunk_size,
-                    chunk_overlap=settings.chunk_overlap
-                )
-                splits = text_splitter.split_documents(documents)
+                splits = [
+                    Document(page_content=chunk, metadata=dict(doc.metadata))
+                    for doc in documents
+                    for chunk in split_text(doc.page_content, settings.chunk_size, settings.chunk_overlap)
+                ]
                 stats["chunks"] = len(splits)
                 
-                # Inicializar o actualizar vectorial BD
+                # Inicializar vectorial BD si no existe
                 if not self.vector_db:
-                    # Crear nueva db
                     if settings.enable_vector_db_persistence:
-                        self.vector_db = Chroma.from_documents(
-                            documents=splits,
-                            embedding=self.embedding_model,
-                            persist_directory=settings.vector_db_path
-                        )
+                        self.vector_db = _get_chroma(settings.vector_db_path, embedding_fingerprint())
                     else:
-                        self.vector_db = Chroma.from_documents(
-                            documents=splits,
-                            embedding=self.embedding_model
+                        self.vector_db = Chroma(
+                            collection_name=_collection_name(embedding_fingerprint()),
+                            embedding_function=self.embedding_model,
+                            collection_metadata=HNSW_COLLECTION_METADATA
                         )
-                else:
-                    # Actualizar BD existente
-                    self.vector_db.add_documents(documents=splits)
-                    if settings.enable_vector_db_persistence:
-                        pass
+                
+                # Añadir los fragmentos por lotes (Chroma persiste automáticamente con persist_directory)
+                for start in range(0, len(splits), ADD_DOCUMENTS_BATCH_SIZE):
+                    self.vector_db.add_documents(documents=splits[start:start + ADD_DOCUMENTS_BATCH_SIZE])
+                self._db_version += 1
+                self._cached_search.cache_clear()
                 logger.info(f"Base de datos vectorial actualizada con {len(splits)} fragmentos")
             
             return {
@@ -126,13 +371,6 @@ class DocumentProcessor:
                 "message": f"Error en el procesamiento: {str(e)}",
                 "stats": stats
             }
-        finally:
-            # Limpiar archivos temporales
-            for temp_file in temp_files:
-                try:
-                    os.unlink(temp_file)
-                except Exception as e:
-                    logger.warning(f"No se pudo eliminar archivo temporal {temp_file}: {str(e)}")
     
     def get_relevant_documents(self, query: str) -> List[Document]:
         """
@@ -149,14 +387,53 @@ class DocumentProcessor:
             return []
         
         try:
-            return self.vector_db.similarity_search(
-                query, 
-                k=settings.retrieval_k
-            )
+            return list(self._cached_search(query, settings.retrieval_k, self._db_version))
         except Exception as e:
             logger.error(f"Error al recuperar documentos relevantes: {str(e)}")
             return []
     
+    def embed_query(self, query: str) -> Tuple[float, ...]:
+        """
+        Calcula el embedding de una consulta, reutilizándolo si ya se calculó.
+        
+        Args:
+            query (str): Consulta del usuario.
+        
+        Returns:
+            Tuple[float, ...]: Embedding de la consulta.
+        """
+        return self._cached_embed(query)
+    
+    def _embed_query(self, query: str) -> Tuple[float, ...]:
+        """
+        Calcula el embedding de una consulta con el modelo configurado.
+        
+        Se invoca a través de una caché LRU; devuelve una tupla para que no se pueda modificar.
+        
+        Args:
+            query (str): Consulta del usuario.
+        
+        Returns:
+            Tuple[float, ...]: Embedding de la consulta.
+        """
+        return tuple(self.embedding_model.embed_query(query))
+    
+    def _search(self, query: str, k: int, db_version: int) -> Tuple[Document, ...]:
+        """
+        Ejecuta la búsqueda por similitud en la base vectorial.
+        
+        Se invoca a través de una caché LRU; db_version solo forma parte de la clave.
+        
+        Args:
+            query (str): Consulta del usuario.
+            k (int): Número de documentos a recuperar.
+            db_version (int): Versión de la base vectorial.
+        
+        Returns:
+            Tuple[Document, ...]: Documentos relevantes.
+        """
+        return tuple(self.vector_db.similarity_search_by_vector(list(self.embed_query(query)), k=k))
+    
     def format_documents(self, docs: List[Document]) -> str:
         """
         Formatea los documentos para incluirlos en el prompt.
@@ -172,12 +449,12 @@ class DocumentProcessor:
         
         formatted_docs = []
         for i, doc in enumerate(docs):
-            source = getattr(doc.metadata, "source", "Desconocido") if hasattr(doc, "metadata") else "Desconocido"
-            page = getattr(doc.metadata, "page", "N/A") if hasattr(doc, "metadata") else "N/A"
-            
-            formatted_docs.append(
-                f"--- Documento {i+1} (Fuente: {source}, Página: {page}) ---\n"
-                f"{doc.page_content}\n"
-            )
+            metadata = doc.metadata or {}
+            formatted_docs.append(_DOC_TEMPLATE.format(
+                index=i + 1,
+                source=metadata.get("source", "Desconocido"),
+                page=metadata.get("page", "N/A"),
+                content=doc.page_content
+            ))
         
         return "\n".join(formatted_docs)
\ No newline at end of file
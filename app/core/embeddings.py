@@ -0,0 +1,110 @@
+"""
+Modelos de embeddings para la indexación y búsqueda de documentos.
+"""
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from config.settings import settings
+from utils.logging_config import setup_logger
+
+logger = setup_logger("embeddings", "embeddings.log")
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Embeddings locales con un modelo tipo sentence-transformers exportado a ONNX.
+    """
+    def __init__(self, model_path: str, tokenizer_path: str, batch_size: int = 64, max_length: int = 512):
+        """
+        Inicializa la sesión de ONNX Runtime y el tokenizador.
+        
+        Args:
+            model_path (str): Ruta al modelo ONNX (fp32 o cuantizado a int8).
+            tokenizer_path (str): Ruta al tokenizer.json del modelo.
+            batch_size (int, optional): Textos por llamada a la sesión. Por defecto 64.
+            max_length (int, optional): Longitud máxima en tokens. Por defecto 512.
+        """
+        # Dependencias opcionales: solo se necesitan con el backend "onnx"
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        
+        self.batch_size = batch_size
+        self.session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+        
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+    
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Calcula los embeddings por lotes con mean pooling y normalización L2.
+        
+        Args:
+            texts (List[str]): Textos a codificar.
+        
+        Returns:
+            List[List[float]]: Un vector por texto.
+        """
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + self.batch_size])
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": attention_mask
+            }
+            if "token_type_ids" in self._input_names:
+                feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+            
+            last_hidden_state = self.session.run(None, feeds)[0]
+            
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (last_hidden_state * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            vectors.extend(pooled.tolist())
+        
+        return vectors
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Calcula los embeddings de una lista de documentos."""
+        return self._embed(list(texts))
+    
+    def embed_query(self, text: str) -> List[float]:
+        """Calcula el embedding de una consulta."""
+        return self._embed([text])[0]
+
+@lru_cache(maxsize=None)
+def get_embedding_model() -> Embeddings:
+    """
+    Devuelve el modelo de embeddings del backend configurado (creado una sola vez).
+    
+    Returns:
+        Embeddings: Modelo de OpenAI o modelo local ONNX.
+    """
+    if settings.embedding_backend == "onnx":
+        logger.info(f"Usando embeddings locales ONNX desde {settings.onnx_model_path}")
+        return OnnxEmbeddings(
+            model_path=settings.onnx_model_path,
+            tokenizer_path=settings.onnx_tokenizer_path,
+            batch_size=settings.onnx_batch_size
+        )
+    
+    return OpenAIEmbeddings(
+        model=settings.embedding_model_name,
+        openai_api_key=settings.openai_api_key
+    )
+
+def embedding_fingerprint() -> str:
+    """
+    Identifica el modelo de embeddings configurado.
+    
+    Returns:
+        str: Backend y modelo, p. ej. "openai:text-embedding-ada-002".
+    """
+    if settings.embedding_backend == "onnx":
+        return f"onnx:{settings.onnx_model_path}"
+    return f"openai:{settings.embedding_model_name}"
\ No newline at end of file
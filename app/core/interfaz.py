@@ -8,8 +8,8 @@ def create_interface(app) -> gr.Blocks:
         with gr.Row():
             gr.Markdown("""
             Este chatbot utiliza RAG (Retrieval-Augmented Generation) para responder preguntas basadas en documentos PDF.
-            También cuenta con memoria dinámica que resume automáticamente conversaciones largas y capacidad de ejecutar código Python
-            para respuestas que requieren precisión numérica.
+            También cuenta con memoria dinámica que conserva los últimos mensajes (o, si se configura, resume las conversaciones largas)
+            y capacidad de ejecutar código Python para respuestas que requieren precisión numérica.
             """)
         
         with gr.Row():
@@ -58,13 +58,15 @@ def create_interface(app) -> gr.Blocks:
         submit_button.click(
             fn=app._chat_and_log,
             inputs=[user_input, chatbot],
-            outputs=[user_input, chatbot]
+            outputs=[user_input, chatbot],
+            queue=True
         )
         
         user_input.submit(
             fn=app._chat_and_log,
             inputs=[user_input, chatbot],
-            outputs=[user_input, chatbot]
+            outputs=[user_input, chatbot],
+            queue=True
         )
         
         clear_button.click(
@@ -79,4 +81,7 @@ def create_interface(app) -> gr.Blocks:
             outputs=[chatbot]
         )
     
+    # La cola es necesaria para las respuestas en streaming (funciones generadoras)
+    demo.queue()
+    
     return demo
\ No newline at end of file
@@ -0,0 +1,49 @@
+"""
+Creación de los modelos de chat de OpenAI con un pool de conexiones HTTP compartido.
+"""
+from functools import lru_cache
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+from config.settings import settings
+
+# Límites del pool compartido por todos los modelos de chat
+HTTP_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10)
+
+@lru_cache(maxsize=None)
+def get_http_client() -> httpx.Client:
+    """
+    Devuelve el cliente HTTP síncrono compartido (creado una sola vez).
+    
+    Returns:
+        httpx.Client: Cliente con conexiones persistentes.
+    """
+    return httpx.Client(limits=HTTP_LIMITS)
+
+@lru_cache(maxsize=None)
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    Devuelve el cliente HTTP asíncrono compartido (creado una sola vez).
+    
+    Returns:
+        httpx.AsyncClient: Cliente con conexiones persistentes para las llamadas async.
+    """
+    return httpx.AsyncClient(limits=HTTP_LIMITS)
+
+def create_chat_model(model_name: str) -> ChatOpenAI:
+    """
+    Crea un modelo de chat que reutiliza las conexiones HTTP compartidas.
+    
+    Args:
+        model_name (str): Nombre del modelo de OpenAI.
+    
+    Returns:
+        ChatOpenAI: Modelo de chat configurado.
+    """
+    return ChatOpenAI(
+        model_name=model_name,
+        openai_api_key=settings.openai_api_key,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client()
+    )
@@ -1,27 +1,67 @@
 """
 Gestión de la memoria de conversación.
 """
-from typing import List, Dict, Any, Optional
-from datetime import datetime
-
-from langchain_openai import ChatOpenAI
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import cached_property
+from itertools import islice
+from typing import List, Optional
 
 from config.settings import settings
+from core.llm_factory import create_chat_model
 from utils.logging_config import setup_logger
 
 logger = setup_logger("memory_manager", "memory_manager.log")
 
+# Etiquetas de rol precalculadas para formatear el historial
+_ROLE_UPPER = {"user": "USER", "assistant": "ASSISTANT", "system": "SYSTEM"}
+
+@dataclass(slots=True, frozen=True)
+class Message:
+    """
+    Mensaje de la conversación (registro compacto e inmutable).
+    """
+    role: str
+    content: str
+    timestamp: int
+    role_upper: str
+    
+    @classmethod
+    def create(cls, role: str, content: str) -> "Message":
+        """
+        Crea un mensaje con la hora actual.
+        
+        Args:
+            role (str): Rol del mensaje (user, assistant, system).
+            content (str): Contenido del mensaje.
+        
+        Returns:
+            Message: Mensaje con la marca de tiempo en nanosegundos desde epoch.
+        """
+        return cls(role, content, time.time_ns(), _ROLE_UPPER.get(role) or role.upper())
+
 class MemoryManager:
     """
     Gestiona la memoria de conversación con resumen dinámico.
     """
     def __init__(self):
         """Inicializa el gestor de memoria."""
-        self.conversation_history = []
-        self.summarizer_llm = ChatOpenAI(
-            model_name=settings.summarizer_model_name,
-            openai_api_key=settings.openai_api_key
-        )
+        # Tope absoluto de mensajes: al llenarse, append descarta el más antiguo
+        self.conversation_history = deque(maxlen=settings.hard_history_cap)
+        # Total de caracteres en la memoria, actualizado en cada inserción o reescritura
+        self._total_chars = 0
+        # Protege conversation_history frente al resumen en segundo plano
+        self._lock = threading.Lock()
+        self._summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-summary")
+        self._summary_future: Optional[Future] = None
+    
+    @cached_property
+    def summarizer_llm(self):
+        """Modelo para resumir, creado en el primer resumen (nunca con la estrategia "sliding")."""
+        return create_chat_model(settings.summarizer_model_name)
     
     def add_message(self, role: str, content: str) -> None:
         """
@@ -31,18 +71,19 @@ class MemoryManager:
             role (str): Rol del mensaje (user, assistant, system).
             content (str): Contenido del mensaje.
         """
-        timestamp = datetime.now().isoformat()
+        message = Message.create(role, content)
         
-        self.conversation_history.append({
-            "role": role,
-            "content": content,
-            "timestamp": timestamp
-        })
+        with self._lock:
+            history = self.conversation_history
+            if len(history) == history.maxlen:
+                self._total_chars -= len(history[0].content)
+            history.append(message)
+            self._total_chars += len(content)
         
         # Verificar si es necesario resumir
         self._check_and_summarize()
     
-    def get_recent_history(self, n: int = 5) -> List[Dict[str, Any]]:
+    def get_recent_history(self, n: int = 5) -> List[Message]:
         """
         Recupera los n mensajes más recientes.
         
@@ -50,9 +91,10 @@ class MemoryManager:
             n (int, optional): Número de mensajes a recuperar. Por defecto 5.
         
         Returns:
-            List[Dict[str, Any]]: Lista de mensajes recientes.
+            List[Message]: Lista de mensajes recientes.
         """
-        return self.conversation_history[-n:] if len(self.conversation_history) > 0 else []
+        with self._lock:
+            return self._tail(n)
     
     def get_formatted_history(self, n: Optional[int] = None) -> str:
         """
@@ -64,50 +106,92 @@ class MemoryManager:
         Returns:
             str: Historial formateado.
         """
-        history = self.conversation_history if n is None else self.conversation_history[-n:]
+        with self._lock:
+            history = list(self.conversation_history) if n is None else self._tail(n)
         
-        formatted = []
-        for msg in history:
-            formatted.append(f"{msg['role'].upper()}: {msg['content']}")
-        
-        return "\n\n".join(formatted)
+        return "\n\n".join(f"{msg.role_upper}: {msg.content}" for msg in history)
     
     def clear_memory(self) -> None:
         """Limpia toda la memoria de conversación."""
-        self.conversation_history = []
+        with self._lock:
+            self.conversation_history.clear()
+            self._total_chars = 0
         logger.info("Memoria de conversación limpiada")
     
+    def discard_last(self, n: int = 2) -> None:
+        """
+        Elimina los n mensajes más recientes (p. ej. para regenerar una respuesta).
+        
+        Args:
+            n (int, optional): Número de mensajes a eliminar. Por defecto 2.
+        """
+        with self._lock:
+            if len(self.conversation_history) < n:
+                return
+            
+            for _ in range(n):
+                self._total_chars -= len(self.conversation_history.pop().content)
+    
+    def _tail(self, n: int) -> List[Message]:
+        """
+        Copia los n mensajes más recientes (el llamador debe tener el lock).
+        
+        Args:
+            n (int): Número de mensajes.
+        
+        Returns:
+            List[Message]: Mensajes en orden cronológico.
+        """
+        size = len(self.conversation_history)
+        return list(islice(self.conversation_history, max(0, size - n), size))
+    
     def _check_and_summarize(self) -> None:
         """
-        Verifica si es necesario resumir la memoria y lo hace si procede.
+        Aplica la estrategia de memoria configurada.
+        
+        Con "sliding" se conservan solo los últimos mensajes (sin llamadas al LLM);
+        con "summary" se resume la memoria en segundo plano cuando supera el límite
+        de tokens, sin bloquear la respuesta al usuario.
         """
+        if settings.memory_strategy == "sliding":
+            window_size = settings.memory_window_size
+            with self._lock:
+                while len(self.conversation_history) > window_size:
+                    self._total_chars -= len(self.conversation_history.popleft().content)
+            return
+        
         if len(self.conversation_history) <= 2:
             return
         
         # Estimar número de tokens (aproximadamente 4 caracteres por token)
-        total_chars = sum(len(entry["content"]) for entry in self.conversation_history)
-        estimated_tokens = total_chars // settings.char_to_token_ratio
+        estimated_tokens = self._total_chars // settings.char_to_token_ratio
         
         if estimated_tokens > settings.max_memory_tokens:
-            logger.info(f"Resumiendo memoria (aprox. {estimated_tokens} tokens)")
-            self._summarize_memory()
+            # Un único resumen en curso a la vez
+            if self._summary_future is None or self._summary_future.done():
+                logger.info(f"Resumiendo memoria (aprox. {estimated_tokens} tokens)")
+                self._summary_future = self._summary_executor.submit(self._summarize_memory)
     
     def _summarize_memory(self) -> None:
         """
         Resume la memoria de conversación manteniendo el contexto importante.
+        
+        Se ejecuta en segundo plano: la llamada al LLM se hace sin el lock y el
+        resumen solo se aplica si los mensajes resumidos siguen en la memoria.
         """
         try:
             # Mantener los últimos 2 intercambios intactos
-            recent_history = self.conversation_history[-4:] if len(self.conversation_history) >= 4 else []
-            history_to_summarize = self.conversation_history[:-4] if len(self.conversation_history) >= 4 else self.conversation_history
+            with self._lock:
+                cut = len(self.conversation_history) - 4 if len(self.conversation_history) >= 4 else len(self.conversation_history)
+                history_to_summarize = list(islice(self.conversation_history, cut))
             
             if not history_to_summarize:
                 return
             
             # Preparar el texto para resumir
-            history_text = ""
-            for entry in history_to_summarize:
-                history_text += f"{entry['role'].upper()}: {entry['content']}\n\n"
+            history_text = "\n\n".join(
+                f"{entry.role_upper}: {entry.content}" for entry in history_to_summarize
+            )
             
             # Resumir la conversación
             summary_prompt = f"""
@@ -124,15 +208,19 @@ class MemoryManager:
             summary_response = self.summarizer_llm.invoke(summary_prompt)
             summary = summary_response.content
             
-            # Crear nueva historia con el resumen
-            timestamp = datetime.now().isoformat()
-            self.conversation_history = [
-                {
-                    "role": "system", 
-                    "content": f"Resumen de la conversación previa: {summary}",
-                    "timestamp": timestamp
-                }
-            ] + recent_history
+            # Crear nueva historia con el resumen y los mensajes posteriores al corte
+            summary_entry = Message.create("system", f"Resumen de la conversación previa: {summary}")
+            with self._lock:
+                current_prefix = list(islice(self.conversation_history, cut))
+                if len(current_prefix) != cut or any(a is not b for a, b in zip(current_prefix, history_to_summarize)):
+                    logger.info("La memoria cambió durante el resumen; se descarta el resumen")
+                    return
+                
+                # Sustituir los mensajes resumidos por el resumen, sin reconstruir la memoria
+                for _ in range(cut):
+                    self._total_chars -= len(self.conversation_history.popleft().content)
+                self.conversation_history.appendleft(summary_entry)
+                self._total_chars += len(summary_entry.content)
             
             logger.info(f"Memoria resumida exitosamente")
         
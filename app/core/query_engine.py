@@ -1,14 +1,61 @@
 """
 Motor de consultas del chatbot.
 """
-from langchain_openai import ChatOpenAI
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 from config.settings import settings
+from core.llm_factory import create_chat_model
 from core.document_processor import DocumentProcessor
 from core.memory_manager import MemoryManager
 from core.code_executor import CodeExecutor
 from utils.logging_config import setup_logger
 logger = setup_logger("query_engine", "query_engine.log")
 
+# Mensajes de la conversación incluidos en el prompt RAG (incluida la consulta actual)
+HISTORY_WINDOW = 5
+
+# Respuesta de error cuando falla el procesamiento RAG
+_RAG_ERROR_RESPONSE = """
+            Lo siento, encontré un error al procesar tu consulta. Por favor, inténtalo de nuevo o reformula tu pregunta.
+            
+            Si el problema persiste, considera reiniciar la conversación.
+            """
+
+# Instrucciones fijas del prompt RAG. Van en un mensaje de sistema al principio para que
+# el prefijo sea idéntico entre llamadas y OpenAI pueda reutilizarlo (prompt caching).
+_RAG_INSTRUCTIONS = """### INSTRUCCIONES
+Eres un asistente de IA que proporciona respuestas precisas y útiles basadas en el contexto de la conversación
+y la información disponible en la base de conocimiento. Cuando la información no esté disponible en los documentos, 
+basa tu respuesta en tu conocimiento general, pero indica claramente cuando lo haces."""
+
+_NO_DOCS_INSTRUCTIONS = """### INSTRUCCIONES
+Eres un asistente de IA que proporciona respuestas precisas y útiles basadas en el contexto de la conversación
+y tu conocimiento general. Sé honesto cuando no sepas algo."""
+
+# Parte variable del prompt RAG (mensaje del usuario)
+_RAG_PROMPT_WITH_DOCS = """### CONTEXTO DE LA CONVERSACIÓN
+{context}
+
+### INFORMACIÓN DE LA BASE DE CONOCIMIENTO
+{docs}
+
+### CONSULTA DEL USUARIO
+{query}
+
+### RESPUESTA"""
+
+_RAG_PROMPT_NO_DOCS = """### CONTEXTO DE LA CONVERSACIÓN
+{context}
+
+### CONSULTA DEL USUARIO
+{query}
+
+### RESPUESTA"""
 
 class QueryEngine:
     """
@@ -28,39 +75,205 @@ class QueryEngine:
         self.code_executor = CodeExecutor()
         
         # Inicializar LLM
-        self.llm = ChatOpenAI(
-            model_name=settings.llm_model_name,
-            openai_api_key=settings.openai_api_key
-        )
+        self.llm = create_chat_model(settings.llm_model_name)
+        
+        # Caché de respuestas: exacta por texto y semántica por similitud de embeddings.
+        # Solo guarda respuestas a la primera consulta de una conversación, las únicas
+        # cuyo prompt no depende del historial y que por tanto pueden repetirse
+        self._cache_lock = threading.Lock()
+        self._exact_cache: "OrderedDict[str, str]" = OrderedDict()
+        self._semantic_vectors: Optional[np.ndarray] = None
+        self._semantic_responses: List[str] = []
 
-    def process_query(self, query: str) -> str:
+    async def process_query(self, query: str, use_cache: bool = True) -> str:
         """
         Procesa una consulta y genera una respuesta.
         
         Args:
             query (str): Consulta del usuario.
+            use_cache (bool, optional): Si se pueden reutilizar respuestas en caché. Por defecto True.
         
         Returns:
             str: Respuesta generada.
         """
         logger.info(f"Procesando consulta: {query}")
         
+        # Solo la primera consulta de la conversación usa la caché
+        cacheable = self._is_first_turn()
+        
         # Añadir la consulta a la memoria
         self.memory_manager.add_message("user", query)
         
         # Determinar si es necesario ejecutar código
         if self.code_executor.detect_code_execution_needed(query):
             logger.info("Se detectó necesidad de ejecución de código")
-            response = self._handle_code_execution(query)
+            response = await asyncio.to_thread(self._handle_code_execution, query)
         else:
-            # Enfoque RAG estándar
-            response = self._handle_rag_query(query)
+            cached_response, query_vector = await asyncio.to_thread(self._lookup_cache, query) if use_cache and cacheable else (None, None)
+            if cached_response is not None:
+                response = cached_response
+            else:
+                # Enfoque RAG estándar
+                response = await self._handle_rag_query(query)
+                if cacheable and response is not _RAG_ERROR_RESPONSE:
+                    await asyncio.to_thread(self._store_in_cache, query, response, query_vector)
         
         # Añadir la respuesta a la memoria
         self.memory_manager.add_message("assistant", response)
         
         return response
 
+    async def stream_query(self, query: str) -> AsyncIterator[str]:
+        """
+        Procesa una consulta y genera la respuesta de forma incremental.
+        
+        Args:
+            query (str): Consulta del usuario.
+        
+        Yields:
+            str: Respuesta acumulada hasta el momento.
+        """
+        logger.info(f"Procesando consulta (streaming): {query}")
+        
+        # Solo la primera consulta de la conversación usa la caché
+        cacheable = self._is_first_turn()
+        
+        # Añadir la consulta a la memoria
+        self.memory_manager.add_message("user", query)
+        
+        response = ""
+        if self.code_executor.detect_code_execution_needed(query):
+            logger.info("Se detectó necesidad de ejecución de código")
+            response = await asyncio.to_thread(self._handle_code_execution, query)
+            yield response
+        else:
+            cached_response, query_vector = await asyncio.to_thread(self._lookup_cache, query) if cacheable else (None, None)
+            if cached_response is not None:
+                response = cached_response
+                yield response
+            else:
+                # Enfoque RAG estándar, transmitiendo los tokens según llegan
+                async for response in self._stream_rag_query(query):
+                    yield response
+                if cacheable and response and response is not _RAG_ERROR_RESPONSE:
+                    await asyncio.to_thread(self._store_in_cache, query, response, query_vector)
+        
+        # Añadir la respuesta completa a la memoria
+        self.memory_manager.add_message("assistant", response)
+
+    def clear_cache(self) -> None:
+        """Vacía la caché de respuestas (al añadir documentos)."""
+        with self._cache_lock:
+            self._exact_cache.clear()
+            self._semantic_vectors = None
+            self._semantic_responses = []
+        logger.info("Caché de respuestas limpiada")
+
+    def _is_first_turn(self) -> bool:
+        """
+        Indica si la consulta actual abre la conversación.
+        
+        Returns:
+            bool: True si aún no hay mensajes en memoria.
+        """
+        return settings.response_cache_size > 0 and not self.memory_manager.conversation_history
+
+    def _embed_for_cache(self, query: str) -> Optional[np.ndarray]:
+        """
+        Calcula el embedding normalizado de una consulta para la caché semántica.
+        
+        Solo se calcula si hay base de datos vectorial: entonces la búsqueda de
+        documentos reutiliza el mismo embedding y la caché no añade llamadas.
+        
+        Args:
+            query (str): Consulta del usuario.
+        
+        Returns:
+            Optional[np.ndarray]: Vector unitario, o None si no se pudo calcular.
+        """
+        if not self.document_processor.vector_db:
+            return None
+        
+        try:
+            vector = np.asarray(self.document_processor.embed_query(query), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"No se pudo calcular el embedding para la caché: {str(e)}")
+            return None
+        
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _lookup_cache(self, query: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Busca una respuesta en caché, primero por coincidencia exacta y luego por similitud.
+        
+        Args:
+            query (str): Consulta del usuario.
+        
+        Returns:
+            Tuple[Optional[str], Optional[np.ndarray]]: Respuesta en caché (o None) y el
+            embedding de la consulta si se llegó a calcular.
+        """
+        with self._cache_lock:
+            response = self._exact_cache.get(query)
+            if response is not None:
+                self._exact_cache.move_to_end(query)
+                logger.info("Respuesta obtenida de la caché exacta")
+                return response, None
+            
+            if self._semantic_vectors is None:
+                return None, None
+        
+        # El embedding puede requerir una llamada de red: se calcula sin el lock
+        query_vector = self._embed_for_cache(query)
+        if query_vector is None:
+            return None, None
+        
+        with self._cache_lock:
+            if self._semantic_vectors is None:
+                return None, query_vector
+            
+            similarities = self._semantic_vectors @ query_vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= settings.semantic_cache_threshold:
+                logger.info(f"Respuesta obtenida de la caché semántica (similitud {similarities[best]:.3f})")
+                return self._semantic_responses[best], query_vector
+        
+        return None, query_vector
+
+    def _store_in_cache(
+        self, query: str, response: str, query_vector: Optional[np.ndarray] = None
+    ) -> None:
+        """
+        Guarda una respuesta en ambas cachés, descartando las entradas más antiguas.
+        
+        Args:
+            query (str): Consulta del usuario.
+            response (str): Respuesta generada.
+            query_vector (np.ndarray, optional): Embedding de la consulta, si ya se calculó.
+        """
+        cache_size = settings.response_cache_size
+        
+        with self._cache_lock:
+            self._exact_cache[query] = response
+            self._exact_cache.move_to_end(query)
+            while len(self._exact_cache) > cache_size:
+                self._exact_cache.popitem(last=False)
+        
+        if query_vector is None:
+            query_vector = self._embed_for_cache(query)
+        if query_vector is None:
+            return
+        
+        # Vectores y respuestas se actualizan juntos para que sigan alineados
+        with self._cache_lock:
+            if self._semantic_vectors is None:
+                self._semantic_vectors = query_vector[np.newaxis, :]
+                self._semantic_responses = [response]
+            else:
+                self._semantic_vectors = np.vstack([self._semantic_vectors, query_vector])[-cache_size:]
+                self._semantic_responses = (self._semantic_responses + [response])[-cache_size:]
+
     def _handle_code_execution(self, query: str) -> str:
         """
         Maneja una consulta que requiere ejecución de código.
@@ -96,7 +309,47 @@ class QueryEngine:
             Error: {str(e)}
             """
 
-    def _handle_rag_query(self, query: str) -> str:
+    async def _build_rag_prompt(self, query: str) -> List[BaseMessage]:
+        """
+        Construye los mensajes del prompt RAG para una consulta.
+        
+        Las instrucciones fijas van en el mensaje de sistema y todo lo variable
+        (conversación, documentos y consulta) en el mensaje del usuario. La búsqueda
+        de documentos y el formateo del historial se ejecutan a la vez en hilos.
+        
+        Args:
+            query (str): Consulta del usuario.
+        
+        Returns:
+            List[BaseMessage]: Mensaje de sistema y mensaje con el contexto de la conversación,
+            los documentos relevantes y la consulta.
+        """
+        # Obtener documentos relevantes y preparar el contexto de la conversación
+        relevant_docs, conversation_context = await asyncio.gather(
+            asyncio.to_thread(self.document_processor.get_relevant_documents, query),
+            asyncio.to_thread(self.memory_manager.get_formatted_history, HISTORY_WINDOW)
+        )
+        
+        # Crear el prompt RAG
+        if relevant_docs:
+            formatted_docs = self.document_processor.format_documents(relevant_docs)
+            
+            return [
+                SystemMessage(content=_RAG_INSTRUCTIONS),
+                HumanMessage(content=_RAG_PROMPT_WITH_DOCS.format(
+                    context=conversation_context,
+                    docs=formatted_docs,
+                    query=query
+                ))
+            ]
+        
+        # Sin documentos relevantes, usar solo el contexto
+        return [
+            SystemMessage(content=_NO_DOCS_INSTRUCTIONS),
+            HumanMessage(content=_RAG_PROMPT_NO_DOCS.format(context=conversation_context, query=query))
+        ]
+
+    async def _handle_rag_query(self, query: str) -> str:
         """
         Maneja una consulta usando RAG.
         
@@ -107,59 +360,38 @@ class QueryEngine:
             str: Respuesta generada con RAG.
         """
         try:
-            # Obtener documentos relevantes
-            relevant_docs = self.document_processor.get_relevant_documents(query)
-            
-            # Preparar el contexto de la conversación
-            conversation_context = self.memory_manager.get_formatted_history(5)
-            
-            # Crear el prompt RAG
-            if relevant_docs:
-                formatted_docs = self.document_processor.format_documents(relevant_docs)
-                
-                rag_prompt = f"""
-                ### INSTRUCCIONES
-                Eres un asistente de IA que proporciona respuestas precisas y útiles basadas en el contexto de la conversación
-                y la información disponible en la base de conocimiento. Cuando la información no esté disponible en los documentos, 
-                basa tu respuesta en tu conocimiento general, pero indica claramente cuando lo haces.
-                
-                ### CONTEXTO DE LA CONVERSACIÓN
-                {conversation_context}
-                
-                ### INFORMACIÓN DE LA BASE DE CONOCIMIENTO
-                {formatted_docs}
-                
-                ### CONSULTA DEL USUARIO
-                {query}
-                
-                ### RESPUESTA
-                """
-            else:
-                # Sin documentos relevantes, usar solo el contexto
-                rag_prompt = f"""
-                ### INSTRUCCIONES
-                Eres un asistente de IA que proporciona respuestas precisas y útiles basadas en el contexto de la conversación
-                y tu conocimiento general. Sé honesto cuando no sepas algo.
-                
-                ### CONTEXTO DE LA CONVERSACIÓN
-                {conversation_context}
-                
-                ### CONSULTA DEL USUARIO
-                {query}
-                
-                ### RESPUESTA
-                """
+            rag_messages = await self._build_rag_prompt(query)
             
             # Generar respuesta
-            response = self.llm.invoke(rag_prompt).content
+            response = (await self.llm.ainvoke(rag_messages)).content
             return response
         
         except Exception as e:
             logger.error(f"Error en procesamiento RAG: {str(e)}")
             
             # Respuesta de error
-            return f"""
-            Lo siento, encontré un error al procesar tu consulta. Por favor, inténtalo de nuevo o reformula tu pregunta.
+            return _RAG_ERROR_RESPONSE
+
+    async def _stream_rag_query(self, query: str) -> AsyncIterator[str]:
+        """
+        Maneja una consulta usando RAG, transmitiendo la respuesta del LLM.
+        
+        Args:
+            query (str): Consulta del usuario.
+        
+        Yields:
+            str: Respuesta acumulada hasta el momento.
+        """
+        try:
+            rag_messages = await self._build_rag_prompt(query)
             
-            Si el problema persiste, considera reiniciar la conversación.
-            """        
\ No newline at end of file
+            response = ""
+            async for chunk in self.llm.astream(rag_messages):
+                response += chunk.content
+                yield response
+        
+        except Exception as e:
+            logger.error(f"Error en procesamiento RAG: {str(e)}")
+            
+            # Respuesta de error
+            yield _RAG_ERROR_RESPONSE
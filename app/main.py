@@ -5,14 +5,33 @@ import os
 import time
 import signal
 import sys
-from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, List, Tuple
 from config.settings import settings
 from core.document_processor import DocumentProcessor
 from core.memory_manager import MemoryManager
 from core.query_engine import QueryEngine
-from utils.logging_config import logger
+from utils.logging_config import setup_logger
 from core.interfaz import create_interface
 
+# Logger principal de la aplicación
+logger = setup_logger("rag_chatbot", "app.log")
+
+# Máximo de archivos subidos leídos a la vez
+MAX_READ_WORKERS = 8
+
+def _read_file(path: str) -> bytes:
+    """
+    Lee un archivo completo en binario.
+    
+    Args:
+        path (str): Ruta del archivo.
+    
+    Returns:
+        bytes: Contenido del archivo.
+    """
+    with open(path, "rb") as f:
+        return f.read()
 
 class ChatbotApp:
     """
@@ -45,14 +64,16 @@ class ChatbotApp:
         start_time = time.time()
         
         try:
-            # Convertir archivos a formato binario
-            file_contents = []
-            for file in files:
-                with open(file.name, "rb") as f:
-                    file_contents.append(f.read())
+            # Convertir archivos a formato binario (lecturas en paralelo)
+            with ThreadPoolExecutor(max_workers=min(MAX_READ_WORKERS, len(files))) as executor:
+                file_contents = list(executor.map(_read_file, (file.name for file in files)))
+            file_names = [os.path.basename(file.name) for file in files]
             
             # Procesar archivos
-            result = self.document_processor.process_pdfs(file_contents)
+            result = self.document_processor.process_pdfs(file_contents, file_names)
+            
+            # Las respuestas en caché pueden no reflejar los nuevos documentos
+            self.query_engine.clear_cache()
             
             elapsed_time = time.time() - start_time
             
@@ -65,32 +86,32 @@ class ChatbotApp:
             logger.error(f"Error al procesar archivos: {str(e)}")
             return f"Error al procesar los archivos: {str(e)}"
 
-    def _chat_and_log(self, query: str, history: List[List[str]]) -> Tuple[str, List[List[str]]]:
+    async def _chat_and_log(self, query: str, history: List[List[str]]) -> AsyncIterator[Tuple[str, List[List[str]]]]:
         """
-        Procesa una consulta del usuario y actualiza el historial.
+        Procesa una consulta del usuario y actualiza el historial a medida que llega la respuesta.
         
         Args:
             query (str): Consulta del usuario.
             history (List[List[str]]): Historial de chat de Gradio.
         
-        Returns:
+        Yields:
             Tuple[str, List[List[str]]]: Input vacío y historial actualizado.
         """
         if not query:
-            return "", history
+            yield "", history
+            return
+        
+        history.append([query, ""])  # Actualizar historial de Gradio
         
         try:
-            response = self.query_engine.process_query(query)
-            
-            history.append([query, response])  # Actualizar historial de Gradio
-            
-            return "", history
+            async for partial_response in self.query_engine.stream_query(query):
+                history[-1][1] = partial_response
+                yield "", history
         
         except Exception as e:
             logger.error(f"Error en el chat: {str(e)}")
-            error_msg = f"Lo siento, ocurrió un error al procesar tu consulta: {str(e)}"
-            history.append([query, error_msg])
-            return "", history
+            history[-1][1] = f"Lo siento, ocurrió un error al procesar tu consulta: {str(e)}"
+            yield "", history
 
     def _clear_chat(self) -> List[List[str]]:
         """
@@ -102,7 +123,7 @@ class ChatbotApp:
         self.memory_manager.clear_memory()
         return []
 
-    def _regenerate_response(self, history: List[List[str]]) -> List[List[str]]:
+    async def _regenerate_response(self, history: List[List[str]]) -> List[List[str]]:
         """
         Regenera la última respuesta.
         
@@ -120,10 +141,9 @@ class ChatbotApp:
         history.pop() # Eliminar la última respuesta del historial
         
         # Actualizar la memoria (eliminar la última interacción)
-        if len(self.memory_manager.conversation_history) >= 2:
-            self.memory_manager.conversation_history = self.memory_manager.conversation_history[:-2]
+        self.memory_manager.discard_last(2)
         
-        response = self.query_engine.process_query(last_query)
+        response = await self.query_engine.process_query(last_query, use_cache=False)
         
         history.append([last_query, response])  # Actualizar historial de Gradio
         
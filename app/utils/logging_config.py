@@ -1,20 +1,100 @@
 """
 Configuración del sistema de logging.
 """
+import atexit
+import copy
+import json
 import logging
+import queue
 import sys
-from logging.handlers import RotatingFileHandler
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 
-from config.settings import settings
+from config.settings import get_log_level
+
+try:
+    import orjson
+except ImportError:  # Serializador opcional; sin él se usa json
+    orjson = None
 
 # Crear directorio de logs si no existe
 log_dir = Path("./logs")
 log_dir.mkdir(parents=True, exist_ok=True)
 
+class JsonFormatter(logging.Formatter):
+    """
+    Formatea cada registro como una línea JSON con la marca de tiempo en bruto (sin strftime).
+    """
+    def format(self, record):
+        entry = {
+            "t": record.created,
+            "name": record.name,
+            "lvl": record.levelname,
+            "msg": record.getMessage()
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if orjson is not None:
+            return orjson.dumps(entry).decode()
+        return json.dumps(entry, ensure_ascii=False)
+
+# Formato del log: legible en consola, JSON en archivos
+log_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+json_format = JsonFormatter()
+
+class _RecordQueueHandler(QueueHandler):
+    """
+    Encola los registros con la traza de la excepción en exc_text en lugar de dentro del mensaje.
+    """
+    def prepare(self, record):
+        # QueueHandler.prepare mezcla la traza en msg y borra exc_info; aquí se conserva aparte
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = log_format.formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+# Los loggers solo encolan registros; un hilo en segundo plano escribe en consola y archivos
+_log_queue = queue.Queue(-1)
+_queue_handler = _RecordQueueHandler(_log_queue)
+
+_console_handler = logging.StreamHandler(sys.stdout)
+_console_handler.setFormatter(log_format)
+
+_listener = QueueListener(_log_queue, _console_handler, respect_handler_level=True)
+_listener.start()
+atexit.register(_listener.stop)
+
+
+def _add_file_handler(name, log_file):
+    """
+    Registra en el listener un handler de archivo para los registros de un logger.
+    
+    Args:
+        name (str): Nombre del logger.
+        log_file (str): Ruta al archivo de log.
+    """
+    file_handler = RotatingFileHandler(
+        log_dir / log_file,
+        maxBytes=10485760,  # 10MB
+        backupCount=5,
+        delay=True  # El archivo se abre con el primer registro
+    )
+    file_handler.setFormatter(json_format)
+    # Solo los registros de este logger van a su archivo
+    file_handler.addFilter(logging.Filter(name))
+    _listener.handlers = _listener.handlers + (file_handler,)
+
+@lru_cache(maxsize=None)
 def setup_logger(name, log_file=None):
     """
-    Configura y devuelve un logger con handlers para consola y archivo.
+    Configura y devuelve un logger que delega la escritura en consola y archivo
+    a un hilo en segundo plano.
     
     Args:
         name (str): Nombre del logger.
@@ -26,32 +106,15 @@ def setup_logger(name, log_file=None):
     logger = logging.getLogger(name)
     
     # Configurar nivel de log según la configuración
-    log_level = getattr(logging, settings.log_level.upper(), logging.INFO)
+    log_level = getattr(logging, get_log_level().upper(), logging.INFO)
     logger.setLevel(log_level)
     
     # Evitar duplicación de logs
-    if logger.handlers:
-        return logger
-    
-    # Formato del log
-    log_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    
-    # Handler para consola
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(log_format)
-    logger.addHandler(console_handler)
+    if _queue_handler not in logger.handlers:
+        logger.addHandler(_queue_handler)
     
     # Handler para archivo (si se especifica)
     if log_file:
-        file_handler = RotatingFileHandler(
-            log_dir / log_file,
-            maxBytes=10485760,  # 10MB
-            backupCount=5
-        )
-        file_handler.setFormatter(log_format)
-        logger.addHandler(file_handler)
+        _add_file_handler(name, log_file)
     
     return logger
-
-# Logger principal de la aplicación
-logger = setup_logger("rag_chatbot", "app.log")
\ No newline at end of file
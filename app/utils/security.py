@@ -3,27 +3,74 @@ Utilidades de seguridad para el chatbot.
 """
 import ast
 import re
-from typing import Tuple
+from typing import Optional, Tuple
+
+from config.settings import get_settings
 
 # Lista de módulos y funciones potencialmente peligrosos
-DANGEROUS_MODULES = [
+DANGEROUS_MODULES = frozenset({
     "os", "subprocess", "sys", "shutil", "socket", "requests", "urllib",
     "ftplib", "paramiko", "telnetlib", "smtplib", "http.server", "socketserver"
-]
+})
 
-DANGEROUS_FUNCTIONS = [
+DANGEROUS_FUNCTIONS = frozenset({
     "eval", "exec", "compile", "globals", "locals", "getattr", "setattr", "delattr",
     "__import__", "open", "file", "input", "raw_input"
-]
+})
 
 DANGEROUS_PATTERNS = [
     r"__[a-zA-Z]+__",  # Métodos dunder
     r"sys\s*\.\s*exit",
     r"os\s*\.\s*system",
     r"subprocess\s*\.\s*(?:call|run|Popen)",
-    r"import\s+(?:" + "|".join(DANGEROUS_MODULES) + ")"
+    r"import\s+(?:" + "|".join(sorted(DANGEROUS_MODULES)) + ")"
 ]
 
+# Todos los patrones en una sola expresión: una pasada sobre el código en lugar de una por patrón
+_COMBINED_DANGEROUS = re.compile("|".join(f"(?P<g{i}>{p})" for i, p in enumerate(DANGEROUS_PATTERNS)))
+
+# Caracteres de control eliminados de la salida (se conservan \n y \r)
+_STRIP_CTRL = str.maketrans("", "", "".join(
+    chr(c) for c in [*range(0x00, 0x0a), 0x0b, 0x0c, *range(0x0e, 0x20), *range(0x7f, 0xa0)]
+))
+
+# Expresiones puramente aritméticas: sin identificadores no hay llamadas, importaciones ni atributos
+_ARITHMETIC_ONLY = re.compile(r"[0-9\s+\-*/%().,<>=!&|^~]+")
+_ARITHMETIC_MAX_LEN = 200
+
+def _find_unsafe(tree: ast.AST) -> Optional[str]:
+    """
+    Recorre el AST de forma iterativa (sin riesgo de RecursionError en expresiones
+    muy anidadas) y se detiene en la primera operación peligrosa.
+    
+    Args:
+        tree (ast.AST): Árbol del código.
+    
+    Returns:
+        Optional[str]: Mensaje de error, o None si no hay operaciones peligrosas.
+    """
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for name in node.names:
+                if name.name in DANGEROUS_MODULES:
+                    return f"Importación no permitida: {name.name}"
+        
+        elif isinstance(node, ast.ImportFrom):
+            if node.module in DANGEROUS_MODULES:
+                return f"Importación desde módulo no permitido: {node.module}"
+        
+        elif isinstance(node, ast.Call):
+            func = node.func
+            if isinstance(func, ast.Name) and func.id in DANGEROUS_FUNCTIONS:
+                return f"Función potencialmente peligrosa: {func.id}"
+            
+            # Verificar atributos (como os.system)
+            if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name):
+                if func.value.id in DANGEROUS_MODULES:
+                    return f"Módulo potencialmente peligroso: {func.value.id}.{func.attr}"
+    
+    return None
+
 def is_safe_code(code: str) -> Tuple[bool, str]:
     """
     Verifica si el código Python es seguro para ejecutar.
@@ -34,39 +81,30 @@ def is_safe_code(code: str) -> Tuple[bool, str]:
     Returns:
         Tuple[bool, str]: (es_seguro, mensaje_error)
     """
+    if len(code) >= get_settings().max_code_len:
+        return False, f"Código demasiado largo ({len(code)} caracteres)"
+    
+    # Aritmética simple: segura sin necesidad de analizar el AST
+    if len(code) < _ARITHMETIC_MAX_LEN and _ARITHMETIC_ONLY.fullmatch(code):
+        return True, ""
+    
     # Verificar patrones peligrosos
-    for pattern in DANGEROUS_PATTERNS:
-        if re.search(pattern, code):
-            return False, f"Patrón de código potencialmente peligroso detectado: {pattern}"
+    match = _COMBINED_DANGEROUS.search(code)
+    if match:
+        return False, f"Patrón de código potencialmente peligroso detectado: {match.group(0)}"
     
     # Analizar el AST
     try:
         parsed = ast.parse(code)
     except SyntaxError as e:
         return False, f"Error de sintaxis: {str(e)}"
+    except (RecursionError, MemoryError):
+        return False, "Código demasiado anidado para analizarlo"
     
-    # Examinar el AST en busca de operaciones peligrosas
-    for node in ast.walk(parsed):
-        # Importaciones peligrosas
-        if isinstance(node, ast.Import):
-            for name in node.names:
-                if name.name in DANGEROUS_MODULES:
-                    return False, f"Importación no permitida: {name.name}"
-        
-        elif isinstance(node, ast.ImportFrom):
-            if node.module in DANGEROUS_MODULES:
-                return False, f"Importación desde módulo no permitido: {node.module}"
-        
-        # Llamadas a funciones peligrosas
-        elif isinstance(node, ast.Call):
-            if isinstance(node.func, ast.Name) and node.func.id in DANGEROUS_FUNCTIONS:
-                return False, f"Función potencialmente peligrosa: {node.func.id}"
-            
-            # Verificar atributos (como os.system)
-            elif isinstance(node.func, ast.Attribute):
-                if isinstance(node.func.value, ast.Name):
-                    if node.func.value.id in DANGEROUS_MODULES:
-                        return False, f"Módulo potencialmente peligroso: {node.func.value.id}.{node.func.attr}"
+    # Examinar el AST en busca de operaciones peligrosas (se detiene en la primera)
+    error_message = _find_unsafe(parsed)
+    if error_message:
+        return False, error_message
     
     return True, ""
 
@@ -84,7 +122,7 @@ def sanitize_code_output(output: str) -> str:
     if len(output) > 10000:
         output = output[:10000] + "... (salida truncada)"
     
-    # Eliminar caracteres de control excepto saltos de línea y tabulaciones
-    output = re.sub(r'[\x00-\x09\x0b\x0c\x0e-\x1f\x7f-\x9f]', '', output)
+    # Eliminar caracteres de control excepto saltos de línea
+    output = output.translate(_STRIP_CTRL)
     
     return output
\ No newline at end of file